@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from django.shortcuts import redirect
 from django.urls import reverse
@@ -23,6 +26,36 @@ from .models import (
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Use PostgreSQL's planner estimate for unfiltered changelists instead of COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 (or 0) until the table has been analyzed.
+            if row and row[0] > 0:
+                return int(row[0])
+        return super().count
+
+
+class PromotionBatchCreateForm(forms.Form):
+    from_class_offering = forms.ModelChoiceField(
+        queryset=ClassOffering.objects.filter(status=ClassOffering.STATUS_ACTIVE),
+        label="From class offering",
+    )
+    notes = forms.CharField(required=False, widget=forms.Textarea, label="Notes")
+
+
 @admin.register(AcademicYear)
 class AcademicYearAdmin(admin.ModelAdmin):
     list_display = ("year", "start_date", "end_date")
@@ -43,21 +76,21 @@ class SubjectAdmin(admin.ModelAdmin):
 
 @admin.register(ClassOffering)
 class ClassOfferingAdmin(admin.ModelAdmin):
-    list_display = ("academic_year", "class_level", "status", "created_at")
+    list_display = ("display_label", "status", "created_at")
     list_filter = ("academic_year", "class_level", "status")
-    search_fields = ("academic_year__year", "class_level__name")
+    search_fields = ("display_label",)
     actions = ["run_promotion"]
 
     def run_promotion(self, request, queryset):
-        count = 0
-        for offering in queryset:
-            try:
-                services.promote_class(run_by=request.user, from_class_offering=offering)
-                count += 1
-            except Exception as exc:
-                self.message_user(request, f"Failed to promote {offering}: {exc}", level=messages.ERROR)
-        if count:
-            self.message_user(request, _(f"Promotion triggered for {count} class(es)."), level=messages.SUCCESS)
+        try:
+            batches = services.promote_classes(
+                run_by=request.user, offerings=queryset.select_related("academic_year", "class_level")
+            )
+        except Exception as exc:
+            self.message_user(request, f"Failed to promote selected classes: {exc}", level=messages.ERROR)
+            return
+        if batches:
+            self.message_user(request, _(f"Promotion triggered for {len(batches)} class(es)."), level=messages.SUCCESS)
 
     run_promotion.short_description = "Promote selected class(es) to next year"
 
@@ -76,24 +109,34 @@ class StudentEnrollmentAdmin(admin.ModelAdmin):
         "enrolled_at",
     )
     list_filter = ("academic_year", "class_offering__class_level", "active")
-    search_fields = ("student__user__username", "student__student_id")
-
-    def get_form(self, request, obj=None, **kwargs):
-        form = super().get_form(request, obj, **kwargs)
-        current_year = timezone.now().year
-        if "academic_year" in form.base_fields:
-            allowed_years = AcademicYear.objects.filter(year__gte=current_year)
-            if obj and obj.academic_year_id:
-                allowed_years = AcademicYear.objects.filter(Q(pk=obj.academic_year_id) | Q(year__gte=current_year))
-            form.base_fields["academic_year"].queryset = allowed_years
-        if "class_offering" in form.base_fields:
-            allowed_offerings = ClassOffering.objects.filter(academic_year__year__gte=current_year)
-            if obj and obj.class_offering_id:
-                allowed_offerings = ClassOffering.objects.filter(
-                    Q(pk=obj.class_offering_id) | Q(academic_year__year__gte=current_year)
+    show_full_result_count = False
+    list_select_related = (
+        "student__user",
+        "academic_year",
+        "class_offering",
+    )
+    search_fields = ("student_identifier__startswith",)
+    raw_id_fields = ("student", "class_offering")
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related(*self.list_select_related)
+        return StudentEnrollment.with_marks_prefetched(qs)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in {"academic_year", "class_offering"}:
+            current_year = timezone.now().year
+            # Keep the edited enrollment's own year/offering selectable even once it is in the past.
+            object_id = request.resolver_match.kwargs.get("object_id") if request.resolver_match else None
+            current = StudentEnrollment.objects.filter(pk=object_id) if object_id else StudentEnrollment.objects.none()
+            if db_field.name == "academic_year":
+                kwargs["queryset"] = AcademicYear.objects.filter(
+                    Q(year__gte=current_year) | Q(pk__in=current.values("academic_year_id"))
+                )
+            else:
+                kwargs["queryset"] = ClassOffering.objects.filter(
+                    Q(academic_year__year__gte=current_year) | Q(pk__in=current.values("class_offering_id"))
                 )
-            form.base_fields["class_offering"].queryset = allowed_offerings
-        return form
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     def overall_grade_display(self, obj):
         return obj.compute_overall_grade() or "N/A"
@@ -111,6 +154,13 @@ class StudentEnrollmentAdmin(admin.ModelAdmin):
 class TeacherAssignmentAdmin(admin.ModelAdmin):
     list_display = ("teacher", "academic_year", "class_offering", "subject", "created_at")
     list_filter = ("academic_year", "class_offering__class_level", "subject")
+    show_full_result_count = False
+    list_select_related = (
+        "teacher__user",
+        "academic_year",
+        "class_offering",
+        "subject",
+    )
     search_fields = ("teacher__user__username", "teacher__employee_code")
 
 
@@ -118,31 +168,49 @@ class TeacherAssignmentAdmin(admin.ModelAdmin):
 class ExamAdmin(admin.ModelAdmin):
     list_display = ("title", "academic_year", "class_offering", "subject", "date", "status", "creator")
     list_filter = ("academic_year", "class_offering__class_level", "subject", "status")
+    list_select_related = (
+        "academic_year",
+        "class_offering",
+        "subject",
+        "creator",
+    )
     search_fields = ("title",)
+    raw_id_fields = ("creator",)
 
 
 @admin.register(ExamMark)
 class ExamMarkAdmin(admin.ModelAdmin):
     list_display = ("exam", "student_enrollment", "marks_obtained", "entered_by", "entered_at")
     list_filter = ("exam__academic_year", "exam__class_offering__class_level")
-    search_fields = ("student_enrollment__student__student_id", "exam__title")
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    list_select_related = (
+        "exam__class_offering",
+        "exam__subject",
+        "student_enrollment__student__user",
+        "student_enrollment__class_offering",
+        "entered_by",
+    )
+    search_fields = ("student_enrollment__student_identifier__startswith", "exam__title")
+    raw_id_fields = ("student_enrollment", "entered_by")
 
 
 @admin.register(PromotionBatch)
 class PromotionBatchAdmin(admin.ModelAdmin):
-    list_display = ("from_class_offering", "to_class_offering", "run_by", "run_at")
-    list_filter = ("from_class_offering__academic_year",)
-    readonly_fields = ("from_class_offering", "to_class_offering", "run_by", "run_at", "notes")
+    list_display = ("from_class_offering", "to_class_offering", "run_by", "run_at", "status")
+    list_filter = ("from_class_offering__academic_year", "status")
+    list_select_related = (
+        "from_class_offering",
+        "to_class_offering",
+        "run_by",
+    )
+    readonly_fields = ("from_class_offering", "to_class_offering", "run_by", "run_at", "status", "notes")
     fields = readonly_fields
 
-    def add_view(self, request, form_url="", extra_context=None):
-        class PromotionBatchCreateForm(forms.Form):
-            from_class_offering = forms.ModelChoiceField(
-                queryset=self.model._meta.apps.get_model("academics", "ClassOffering").objects.all(),
-                label="From class offering",
-            )
-            notes = forms.CharField(required=False, widget=forms.Textarea, label="Notes")
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("notes")
 
+    def add_view(self, request, form_url="", extra_context=None):
         if request.method == "POST":
             form = PromotionBatchCreateForm(request.POST)
             if form.is_valid():
@@ -178,4 +246,14 @@ class PromotionBatchAdmin(admin.ModelAdmin):
 class PromotionResultAdmin(admin.ModelAdmin):
     list_display = ("batch", "student", "status", "created_at")
     list_filter = ("status", "batch__from_class_offering__academic_year")
+    show_full_result_count = False
+    list_select_related = (
+        "batch__from_class_offering",
+        "batch__to_class_offering",
+        "student__user",
+    )
     search_fields = ("student__student_id", "student__user__username")
+    raw_id_fields = ("batch", "student", "from_enrollment", "to_enrollment")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("notes")
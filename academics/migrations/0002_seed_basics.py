@@ -7,17 +7,13 @@ def seed_years_classes_subjects(apps, schema_editor):
     ClassLevel = apps.get_model("academics", "ClassLevel")
     Subject = apps.get_model("academics", "Subject")
 
-    years = []
-    for year in range(2025, 2051):
-        years.append(
-            AcademicYear(
-                year=year,
-                start_date=date(year, 1, 1),
-                end_date=date(year, 12, 31),
-            )
+    year_table = schema_editor.quote_name(AcademicYear._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {year_table} (year, start_date, end_date) VALUES (%s, %s, %s) "
+            "ON CONFLICT (year) DO NOTHING",
+            [(year, date(year, 1, 1), date(year, 12, 31)) for year in range(2025, 2051)],
         )
-    existing_years = set(AcademicYear.objects.values_list("year", flat=True))
-    AcademicYear.objects.bulk_create([y for y in years if y.year not in existing_years], ignore_conflicts=True)
 
     class_levels = [
         {"code": 6, "name": "CLASS 6"},
@@ -26,12 +22,13 @@ def seed_years_classes_subjects(apps, schema_editor):
         {"code": 9, "name": "CLASS 9"},
         {"code": 10, "name": "CLASS 10"},
     ]
-    for item in class_levels:
-        ClassLevel.objects.update_or_create(code=item["code"], defaults={"name": item["name"]})
+    ClassLevel.objects.bulk_create(
+        [ClassLevel(code=item["code"], name=item["name"]) for item in class_levels],
+        ignore_conflicts=True,
+    )
 
     subjects = ["BANGLA", "ENGLISH", "MATH", "SCIENCE"]
-    for subj in subjects:
-        Subject.objects.update_or_create(name=subj, defaults={"name": subj})
+    Subject.objects.bulk_create([Subject(name=subj) for subj in subjects], ignore_conflicts=True)
 
 
 def noop(apps, schema_editor):
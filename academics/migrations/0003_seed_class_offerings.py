@@ -8,13 +8,17 @@ def seed_class_offerings(apps, schema_editor):
 
     years = list(AcademicYear.objects.all())
     class_levels = list(ClassLevel.objects.all())
-    for year in years:
-        for level in class_levels:
-            ClassOffering.objects.get_or_create(
-                academic_year=year,
-                class_level=level,
-                defaults={"status": "active"},
-            )
+    existing = set(ClassOffering.objects.values_list("academic_year_id", "class_level_id"))
+    ClassOffering.objects.bulk_create(
+        [
+            ClassOffering(academic_year=year, class_level=level, status="active")
+            for year in years
+            for level in class_levels
+            if (year.pk, level.pk) not in existing
+        ],
+        ignore_conflicts=True,
+        batch_size=500,
+    )
 
 
 def noop(apps, schema_editor):
@@ -17,13 +17,16 @@ def add_2024_year(apps, schema_editor):
         },
     )
 
-    class_levels = list(ClassLevel.objects.all())
-    for level in class_levels:
-        ClassOffering.objects.get_or_create(
-            academic_year=year_obj,
-            class_level=level,
-            defaults={"status": "active"},
-        )
+    existing = set(ClassOffering.objects.filter(academic_year=year_obj).values_list("class_level_id", flat=True))
+    ClassOffering.objects.bulk_create(
+        [
+            ClassOffering(academic_year=year_obj, class_level=level, status="active")
+            for level in ClassLevel.objects.all()
+            if level.pk not in existing
+        ],
+        ignore_conflicts=True,
+        batch_size=500,
+    )
 
 
 def noop(apps, schema_editor):
@@ -3,11 +3,19 @@ from django.db import migrations, models
 
 def backfill_student_ids(apps, schema_editor):
     StudentEnrollment = apps.get_model("academics", "StudentEnrollment")
-    for enrollment in StudentEnrollment.objects.select_related("student"):
-        sid = getattr(enrollment.student, "student_id", "") or ""
-        if sid and enrollment.student_identifier != sid:
-            enrollment.student_identifier = sid
-            enrollment.save(update_fields=["student_identifier"])
+    StudentProfile = apps.get_model("accounts", "StudentProfile")
+    quote = schema_editor.quote_name
+    enrollment_table = quote(StudentEnrollment._meta.db_table)
+    profile_table = quote(StudentProfile._meta.db_table)
+    # One set-based UPDATE instead of a save() per enrollment.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {enrollment_table} AS se SET student_identifier = sp.student_id "
+            f"FROM {profile_table} AS sp "
+            "WHERE se.student_id = sp.id "
+            "AND COALESCE(sp.student_id, '') <> '' "
+            "AND se.student_identifier <> sp.student_id"
+        )
 
 
 def noop(apps, schema_editor):
@@ -5,19 +5,21 @@ def sync_roll_numbers(apps, schema_editor):
     StudentProfile = apps.get_model("accounts", "StudentProfile")
     StudentEnrollment = apps.get_model("academics", "StudentEnrollment")
 
-    for student in StudentProfile.objects.all():
-        enrollment = (
-            StudentEnrollment.objects.filter(student=student, active=True)
-            .select_related("academic_year")
-            .order_by("-academic_year__year")
-            .first()
-        )
-        if not enrollment:
-            continue
-        roll = enrollment.roll_number
+    # Latest active enrollment per student, fetched in a single query.
+    latest = StudentEnrollment.objects.filter(active=True).order_by("student_id", "-academic_year__year")
+    if schema_editor.connection.vendor == "postgresql":
+        latest = latest.distinct("student_id")
+    rolls = {}
+    for student_id, roll in latest.values_list("student_id", "roll_number"):
+        rolls.setdefault(student_id, roll)
+
+    changed = []
+    for student in StudentProfile.objects.filter(pk__in=rolls).only("id", "roll_number"):
+        roll = rolls[student.pk]
         if roll is not None and student.roll_number != roll:
             student.roll_number = roll
-            student.save(update_fields=["roll_number"])
+            changed.append(student)
+    StudentProfile.objects.bulk_update(changed, ["roll_number"], batch_size=1000)
 
 
 def noop(apps, schema_editor):
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0007_unique_class_subject_assignment"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="studentenrollment",
+            index=models.Index(fields=["academic_year", "class_offering", "active"], name="se_year_co_active_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="promotionresult",
+            index=models.Index(fields=["batch", "status"], name="pr_batch_status_idx"),
+        ),
+    ]
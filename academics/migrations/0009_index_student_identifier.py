@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0008_admin_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="studentenrollment",
+            name="student_identifier",
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+    ]
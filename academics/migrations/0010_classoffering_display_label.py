@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def populate_display_labels(apps, schema_editor):
+    ClassOffering = apps.get_model("academics", "ClassOffering")
+    AcademicYear = apps.get_model("academics", "AcademicYear")
+    ClassLevel = apps.get_model("academics", "ClassLevel")
+    quote = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(ClassOffering._meta.db_table)} AS co "
+            "SET display_label = CAST(ay.year AS varchar(16)) || ' - ' || cl.name "
+            f"FROM {quote(AcademicYear._meta.db_table)} AS ay, {quote(ClassLevel._meta.db_table)} AS cl "
+            "WHERE co.academic_year_id = ay.id AND co.class_level_id = cl.id"
+        )
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0009_index_student_identifier"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="classoffering",
+            name="display_label",
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(populate_display_labels, reverse_code=noop),
+    ]
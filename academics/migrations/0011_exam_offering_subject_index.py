@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0010_classoffering_display_label"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="exam",
+            index=models.Index(fields=["class_offering", "subject"], name="exam_offering_subject_idx"),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def seed_next_roll(apps, schema_editor):
+    ClassOffering = apps.get_model("academics", "ClassOffering")
+    StudentEnrollment = apps.get_model("academics", "StudentEnrollment")
+    max_roll = (
+        StudentEnrollment.objects.filter(class_offering=OuterRef("pk"))
+        .order_by()
+        .values("class_offering")
+        .annotate(max_roll=Max("roll_number"))
+        .values("max_roll")
+    )
+    ClassOffering.objects.update(next_roll=Coalesce(Subquery(max_roll), 0))
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0011_exam_offering_subject_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="classoffering",
+            name="next_roll",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(seed_next_roll, reverse_code=noop),
+    ]
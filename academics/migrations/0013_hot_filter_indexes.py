@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0012_classoffering_next_roll"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="exam",
+            index=models.Index(fields=["class_offering", "date"], name="exam_offering_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="exammark",
+            index=models.Index(fields=["student_enrollment", "exam"], name="mark_enrollment_exam_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="studentenrollment",
+            index=models.Index(fields=["class_offering", "active"], name="se_co_active_idx"),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def mark_existing_completed(apps, schema_editor):
+    # Batches recorded before the status field ran to completion in one transaction.
+    PromotionBatch = apps.get_model("academics", "PromotionBatch")
+    PromotionBatch.objects.update(status="completed")
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("academics", "0013_hot_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="promotionbatch",
+            name="status",
+            field=models.CharField(
+                choices=[("pending", "Pending"), ("completed", "Completed"), ("partial", "Partial")],
+                default="pending",
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(mark_existing_completed, reverse_code=noop),
+    ]
@@ -2,12 +2,16 @@ from __future__ import annotations
 
 from collections import defaultdict
 from datetime import date
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, Optional
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Max, Q
+from django.db import connection, models, transaction
+from django.db.models import Case, F, FloatField, Prefetch, Q, Value, When, Window
+from django.db.models.functions import Cast, RowNumber
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 from accounts.models import StudentProfile, TeacherProfile
@@ -17,18 +21,43 @@ def current_year_value() -> int:
     return timezone.now().year
 
 
+def mark_percent_expression() -> Case:
+    """
+    SQL expression for an ExamMark's percentage of its exam's max marks (0 when max is 0).
+    """
+    return Case(
+        When(exam__max_marks=0, then=Value(0.0)),
+        default=Cast("marks_obtained", FloatField()) * 100.0 / F("exam__max_marks"),
+        output_field=FloatField(),
+    )
+
+
+# Grades average only the latest few exams of each subject.
+GRADED_EXAMS_PER_SUBJECT = 3
+
+
+def latest_marks_per_subject(marks: models.QuerySet) -> models.QuerySet:
+    """
+    Narrow an ExamMark queryset to each enrollment's latest graded exams per subject.
+
+    This is the grading rule; averages, overall grades and promotion pass/fail all build
+    on it so they agree even if a subject ever holds more exams than the cap.
+    """
+    return marks.annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F("student_enrollment_id"), F("exam__subject_id")],
+            order_by=[F("exam__date").desc(), F("exam_id").desc()],
+        )
+    ).filter(rank__lte=GRADED_EXAMS_PER_SUBJECT)
+
+
+# Grade per 10-point band: index is int(percent) // 10, clamped to 0..10.
+_GRADE_TABLE = ("F",) * 4 + ("D", "C", "B", "A") + ("A+",) * 3
+
+
 def grade_from_percent(percent: float) -> str:
-    if percent >= 80:
-        return "A+"
-    if percent >= 70:
-        return "A"
-    if percent >= 60:
-        return "B"
-    if percent >= 50:
-        return "C"
-    if percent >= 40:
-        return "D"
-    return "F"
+    return _GRADE_TABLE[min(max(int(percent) // 10, 0), 10)]
 
 
 class AcademicYear(models.Model):
@@ -61,6 +90,24 @@ class ClassLevel(models.Model):
         return self.name
 
 
+@lru_cache(maxsize=1)
+def _cached_class_levels() -> Dict[int, ClassLevel]:
+    return {cl.code: cl for cl in ClassLevel.objects.all()}
+
+
+def class_levels_by_code() -> Dict[int, ClassLevel]:
+    """
+    Returns code -> ClassLevel, loaded once per process and cleared when a level changes.
+    """
+    return dict(_cached_class_levels())
+
+
+@receiver(post_save, sender=ClassLevel)
+@receiver(post_delete, sender=ClassLevel)
+def clear_class_levels_cache(sender, **kwargs):
+    _cached_class_levels.cache_clear()
+
+
 class Subject(models.Model):
     name = models.CharField(max_length=64, unique=True)
 
@@ -82,6 +129,10 @@ class ClassOffering(models.Model):
     academic_year = models.ForeignKey(AcademicYear, on_delete=models.PROTECT, related_name="class_offerings")
     class_level = models.ForeignKey(ClassLevel, on_delete=models.PROTECT, related_name="class_offerings")
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    # Denormalized "<year> - <class>" so list views can render offerings without joins.
+    display_label = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    # Highest roll number handed out so far; bumped atomically by reserve_roll_numbers().
+    next_roll = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -90,14 +141,60 @@ class ClassOffering(models.Model):
         ordering = ["academic_year__year", "class_level__code"]
 
     def __str__(self) -> str:
+        return self.display_label or self.build_display_label()
+
+    def build_display_label(self) -> str:
         return f"{self.academic_year.year} - {self.class_level.name}"
 
+    def reserve_roll_numbers(self, count: int = 1) -> int:
+        """
+        Atomically reserve ``count`` consecutive roll numbers and return the first one.
+        """
+        table = connection.ops.quote_name(self._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET next_roll = next_roll + %s WHERE id = %s RETURNING next_roll",
+                [count, self.pk],
+            )
+            (last_roll,) = cursor.fetchone()
+        self.next_roll = last_roll
+        return last_roll - count + 1
+
+    def save(self, *args, **kwargs):
+        self.display_label = self.build_display_label()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None and not self._state.adding:
+            # next_roll is owned by reserve_roll_numbers(); writing back a stale loaded
+            # value would rewind the counter and hand out duplicate roll numbers.
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "next_roll"
+            ]
+        elif update_fields is not None and "display_label" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "display_label"]
+        super().save(*args, **kwargs)
+
+
+@receiver(post_save, sender=AcademicYear)
+@receiver(post_save, sender=ClassLevel)
+def refresh_class_offering_labels(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep stored ClassOffering labels in step with renamed years and class levels.
+    """
+    if created or raw:
+        return
+    offerings = list(instance.class_offerings.select_related("academic_year", "class_level"))
+    for offering in offerings:
+        offering.display_label = offering.build_display_label()
+    ClassOffering.objects.bulk_update(offerings, ["display_label"])
+
 
 class StudentEnrollment(models.Model):
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name="enrollments")
     academic_year = models.ForeignKey(AcademicYear, on_delete=models.PROTECT, related_name="enrollments")
     class_offering = models.ForeignKey(ClassOffering, on_delete=models.PROTECT, related_name="enrollments")
-    student_identifier = models.CharField(max_length=16, blank=True, editable=False)
+    student_identifier = models.CharField(max_length=16, blank=True, editable=False, db_index=True)
     roll_number = models.PositiveIntegerField(null=True, blank=True, editable=False)
     active = models.BooleanField(default=True)
     enrolled_at = models.DateTimeField(auto_now_add=True)
@@ -117,23 +214,51 @@ class StudentEnrollment(models.Model):
                 name="uniq_roll_per_class_offering",
             ),
         ]
+        indexes = [
+            models.Index(fields=["academic_year", "class_offering", "active"], name="se_year_co_active_idx"),
+            models.Index(fields=["class_offering", "active"], name="se_co_active_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.student} -> {self.class_offering} (id {self.student_identifier or 'TBD'} / roll {self.roll_number or 'TBD'})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "academic_year_id" in instance.__dict__:
+            # Remember the stored year so clean() can detect year changes without a query.
+            instance._loaded_academic_year_id = instance.academic_year_id
+        return instance
+
+    def _stored_academic_year_id(self):
+        if not self.pk:
+            return None
+        if hasattr(self, "_loaded_academic_year_id"):
+            return self._loaded_academic_year_id
+        return self.__class__.objects.filter(pk=self.pk).values_list("academic_year_id", flat=True).first()
+
+    @classmethod
+    def with_marks_prefetched(cls, qs=None):
+        """
+        Prefetches exam marks (latest first) so compute_overall_percent() runs without
+        a query per enrollment.
+        """
+        if qs is None:
+            qs = cls.objects.all()
+        return qs.prefetch_related(
+            Prefetch(
+                "exam_marks",
+                queryset=ExamMark.objects.select_related("exam").order_by("-exam__date", "-exam_id"),
+            )
+        )
+
     def clean(self):
         if self.class_offering and self.academic_year and self.class_offering.academic_year_id != self.academic_year_id:
             raise ValidationError("Academic year must match the class offering year.")
         if self.academic_year:
             current_year = current_year_value()
-            previous_year = None
-            if self.pk:
-                previous_year = (
-                    self.__class__.objects.filter(pk=self.pk)
-                    .values_list("academic_year__year", flat=True)
-                    .first()
-                )
-            if (previous_year is None or previous_year != self.academic_year.year) and self.academic_year.year < current_year:
+            previous_year_id = self._stored_academic_year_id()
+            if previous_year_id != self.academic_year_id and self.academic_year.year < current_year:
                 raise ValidationError("Cannot enroll students in past academic years.")
         if self.academic_year and self.active:
             clash = StudentEnrollment.objects.filter(
@@ -147,15 +272,9 @@ class StudentEnrollment(models.Model):
     def _assign_roll_if_missing(self):
         if self.roll_number:
             return
-        existing_max = (
-            StudentEnrollment.objects.filter(class_offering=self.class_offering)
-            .aggregate(Max("roll_number"))
-            .get("roll_number__max")
-            or 0
-        )
-        self.roll_number = existing_max + 1
+        self.roll_number = self.class_offering.reserve_roll_numbers()
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, skip_clean=False, **kwargs):
         if self.class_offering and not self.academic_year_id:
             self.academic_year = self.class_offering.academic_year
         if self.student and not self.student.student_id:
@@ -163,30 +282,68 @@ class StudentEnrollment(models.Model):
             self.student.assign_student_id(persist=True)
         if self.student:
             self.student_identifier = self.student.student_id
-        if self.class_offering:
-            self._assign_roll_if_missing()
-        self.full_clean()
-        super().save(*args, **kwargs)
+        if not skip_clean:
+            # Every field is a required FK or filled in above, so clean_fields() has nothing to add.
+            self.clean()
+            self.validate_unique()
+            self.validate_constraints()
+        # Reserve the roll only once validation passed, and in the INSERT's transaction,
+        # so a rejected or failed save doesn't burn a roll number.
+        reserving = self.class_offering_id is not None and not self.roll_number
+        try:
+            with transaction.atomic():
+                if reserving:
+                    self._assign_roll_if_missing()
+                super().save(*args, **kwargs)
+        except Exception:
+            if reserving:
+                # The reservation rolled back with the INSERT; don't keep a number others may get.
+                self.roll_number = None
+            raise
+        self._loaded_academic_year_id = self.academic_year_id
         if self.active and self.student and self.roll_number is not None:
             # Keep profile roll in sync with current active enrollment.
+            class_level_id = self.class_offering.class_level_id
+            StudentProfile.objects.filter(pk=self.student_id).update(
+                roll_number=self.roll_number,
+                current_academic_year_id=self.academic_year_id,
+                current_class_level_id=class_level_id,
+            )
             self.student.roll_number = self.roll_number
-            self.student.current_academic_year = self.academic_year
-            self.student.current_class_level = self.class_offering.class_level
-            self.student.save(update_fields=["roll_number", "current_academic_year", "current_class_level"])
+            self.student.current_academic_year_id = self.academic_year_id
+            self.student.current_class_level_id = class_level_id
 
-    def compute_overall_percent(self):
-        marks = list(
-            self.exam_marks.select_related("exam__subject", "exam").order_by("-exam__date", "-exam_id")
-        )
-        if not marks:
-            return None
+    def _latest_subject_scores(self):
+        """
+        Returns subject_id -> percentages of the latest graded exams in that subject.
+        """
         subject_scores = defaultdict(list)
-        for mark in marks:
-            max_marks = float(mark.exam.max_marks) if mark.exam.max_marks else 0
-            percent = float(mark.marks_obtained) / max_marks * 100 if max_marks else 0
-            scores = subject_scores[mark.exam.subject_id]
-            if len(scores) < 3:
-                scores.append(percent)
+        if "exam_marks" in getattr(self, "_prefetched_objects_cache", {}):
+            # Reuse marks prefetched by list views (see with_marks_prefetched) instead of querying;
+            # same ordering and cap as latest_marks_per_subject().
+            marks = sorted(self.exam_marks.all(), key=lambda mark: (mark.exam.date, mark.exam_id), reverse=True)
+            for mark in marks:
+                max_marks = float(mark.exam.max_marks) if mark.exam.max_marks else 0
+                percent = float(mark.marks_obtained) / max_marks * 100 if max_marks else 0
+                scores = subject_scores[mark.exam.subject_id]
+                if len(scores) < GRADED_EXAMS_PER_SUBJECT:
+                    scores.append(percent)
+            return subject_scores
+
+        # Rank marks per subject in SQL so only the graded ones are transferred.
+        ranked = (
+            latest_marks_per_subject(
+                ExamMark.objects.filter(student_enrollment=self).annotate(percent=mark_percent_expression())
+            )
+            .order_by()
+            .values_list("exam__subject_id", "percent")
+        )
+        for subject_id, percent in ranked:
+            subject_scores[subject_id].append(percent)
+        return subject_scores
+
+    def compute_overall_percent(self):
+        subject_scores = self._latest_subject_scores()
         if not subject_scores:
             return None
         subject_avgs = [sum(scores) / len(scores) for scores in subject_scores.values() if scores]
@@ -226,10 +383,11 @@ class TeacherAssignment(models.Model):
         if self.academic_year and self.academic_year.year < today_year:
             raise ValidationError("Cannot assign teachers to past academic years.")
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, skip_clean=False, **kwargs):
         if self.class_offering and not self.academic_year_id:
             self.academic_year = self.class_offering.academic_year
-        self.full_clean()
+        if not skip_clean:
+            self.full_clean()
         super().save(*args, **kwargs)
 
 
@@ -254,6 +412,10 @@ class Exam(models.Model):
 
     class Meta:
         ordering = ["-date", "class_offering__academic_year__year", "class_offering__class_level__code"]
+        indexes = [
+            models.Index(fields=["class_offering", "subject"], name="exam_offering_subject_idx"),
+            models.Index(fields=["class_offering", "date"], name="exam_offering_date_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.title} - {self.class_offering} ({self.subject})"
@@ -269,21 +431,30 @@ class Exam(models.Model):
         current_year = current_year_value()
         if self.academic_year and self.academic_year.year != current_year:
             raise ValidationError("Exams can only be created for the current academic year.")
-        if self.max_marks > 100:
+        if self.max_marks is not None and self.max_marks > 100:
             raise ValidationError("Max marks cannot exceed 100.")
         if self.class_offering and self.subject:
-            existing_count = (
-                Exam.objects.filter(class_offering=self.class_offering, subject=self.subject)
+            # Only "are there already 3?" matters, so bound the scan with LIMIT 3.
+            existing_count = len(
+                Exam.objects.filter(class_offering_id=self.class_offering_id, subject_id=self.subject_id)
                 .exclude(pk=self.pk)
-                .count()
+                .order_by()
+                .values_list("pk", flat=True)[:3]
             )
             if existing_count >= 3:
                 raise ValidationError("Cannot create more than 3 exams for this subject in this class offering.")
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, skip_clean=False, **kwargs):
         if self.class_offering and not self.academic_year_id:
             self.academic_year = self.class_offering.academic_year
-        self.full_clean()
+        if not skip_clean:
+            # services.create_exam saves without a form, so the title, status and max_marks
+            # validators still run here. Foreign keys are skipped: each check is a query and
+            # the database enforces them anyway.
+            self.clean_fields(exclude=["class_offering", "academic_year", "subject", "creator"])
+            self.clean()
+            self.validate_unique()
+            self.validate_constraints()
         super().save(*args, **kwargs)
 
 
@@ -297,6 +468,9 @@ class ExamMark(models.Model):
     class Meta:
         unique_together = ("exam", "student_enrollment")
         ordering = ["exam__date", "student_enrollment__roll_number"]
+        indexes = [
+            models.Index(fields=["student_enrollment", "exam"], name="mark_enrollment_exam_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.student_enrollment} -> {self.exam} = {self.marks_obtained}"
@@ -308,18 +482,30 @@ class ExamMark(models.Model):
             if self.exam.academic_year_id != self.student_enrollment.academic_year_id:
                 raise ValidationError("Exam and enrollment must match academic years.")
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, skip_clean=False, **kwargs):
+        if not skip_clean:
+            self.full_clean()
         super().save(*args, **kwargs)
 
 
 class PromotionBatch(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_COMPLETED = "completed"
+    STATUS_PARTIAL = "partial"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_PARTIAL, "Partial"),
+    ]
+
     from_class_offering = models.ForeignKey(
         ClassOffering, on_delete=models.PROTECT, related_name="promotion_batches_from"
     )
     to_class_offering = models.ForeignKey(ClassOffering, on_delete=models.PROTECT, related_name="promotion_batches_to")
     run_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="promotion_batches")
     run_at = models.DateTimeField(auto_now_add=True)
+    # Stays pending until every promotion of the run has committed, so an interrupted run shows.
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
     notes = models.TextField(blank=True)
 
     class Meta:
@@ -339,8 +525,9 @@ class PromotionBatch(models.Model):
             if self.to_class_offering.academic_year.year != self.from_class_offering.academic_year.year + 1:
                 raise ValidationError("Promotion target academic year must be the next year.")
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, skip_clean=False, **kwargs):
+        if not skip_clean:
+            self.full_clean()
         super().save(*args, **kwargs)
 
 
@@ -368,6 +555,9 @@ class PromotionResult(models.Model):
 
     class Meta:
         ordering = ["student__user__username", "-created_at"]
+        indexes = [
+            models.Index(fields=["batch", "status"], name="pr_batch_status_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.student} {self.status}"
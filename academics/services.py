@@ -7,6 +7,7 @@ from typing import Dict, Iterable, List, Tuple
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
+from django.db.models import Avg, Exists, OuterRef, Q
 from django.utils import timezone
 
 from accounts.models import StudentProfile, TeacherProfile
@@ -21,12 +22,29 @@ from .models import (
     StudentEnrollment,
     Subject,
     TeacherAssignment,
+    class_levels_by_code,
+    grade_from_percent,
+    latest_marks_per_subject,
+    mark_percent_expression,
 )
 
 
-def get_current_academic_year() -> AcademicYear:
+PROMOTION_CHUNK_SIZE = 200
+
+
+def get_current_academic_year(request=None) -> AcademicYear:
+    """
+    Returns this calendar year's AcademicYear, falling back to the latest one.
+
+    When a request is given, the result is memoized on it so each request looks it up once.
+    """
+    if request is not None and hasattr(request, "_current_academic_year"):
+        return request._current_academic_year
     year = timezone.now().year
-    return AcademicYear.objects.filter(year=year).first() or AcademicYear.objects.order_by("-year").first()
+    current = AcademicYear.objects.filter(year=year).first() or AcademicYear.objects.order_by("-year").first()
+    if request is not None:
+        request._current_academic_year = current
+    return current
 
 
 def get_or_create_offering(academic_year: AcademicYear, class_level: ClassLevel) -> ClassOffering:
@@ -56,13 +74,22 @@ def assign_teacher(teacher: TeacherProfile, class_offering: ClassOffering, subje
     return assignment
 
 
+def _assigned_key_set(user: User) -> set:
+    """
+    Returns the user's (class_offering_id, subject_id) teaching assignments, cached on
+    the user object so repeated permission checks within a request share one query.
+    """
+    keys = getattr(user, "_assigned_keys", None)
+    if keys is None:
+        keys = set(
+            TeacherAssignment.objects.filter(teacher__user=user).values_list("class_offering_id", "subject_id")
+        )
+        user._assigned_keys = keys
+    return keys
+
+
 def _is_teacher_assigned(user: User, class_offering: ClassOffering, subject: Subject) -> bool:
-    teacher_profile = getattr(user, "teacher_profile", None)
-    if not teacher_profile:
-        return False
-    return TeacherAssignment.objects.filter(
-        teacher=teacher_profile, class_offering=class_offering, subject=subject
-    ).exists()
+    return (class_offering.id, subject.id) in _assigned_key_set(user)
 
 
 def create_exam(
@@ -94,47 +121,20 @@ def create_exam(
 def record_marks(user: User, exam: Exam, marks: Dict[StudentEnrollment, float]) -> List[ExamMark]:
     if not (user.is_superuser or _is_teacher_assigned(user, exam.class_offering, exam.subject)):
         raise PermissionDenied("User cannot enter marks for this exam.")
-    saved: List[ExamMark] = []
+    if any(enrollment.class_offering_id != exam.class_offering_id for enrollment in marks):
+        raise ValidationError("All marks must belong to the exam class offering.")
+    rows = [
+        ExamMark(exam=exam, student_enrollment=enrollment, marks_obtained=value, entered_by=user)
+        for enrollment, value in marks.items()
+    ]
+    # One INSERT ... ON CONFLICT DO UPDATE instead of a lookup and write per student.
     with transaction.atomic():
-        for enrollment, value in marks.items():
-            if enrollment.class_offering_id != exam.class_offering_id:
-                raise ValidationError("All marks must belong to the exam class offering.")
-            mark, _ = ExamMark.objects.update_or_create(
-                exam=exam,
-                student_enrollment=enrollment,
-                defaults={"marks_obtained": value, "entered_by": user},
-            )
-            saved.append(mark)
-    return saved
-
-
-def _compute_subject_averages(
-    class_offering: ClassOffering,
-) -> Dict[int, Dict[int, float]]:
-    """
-    Returns mapping student_enrollment_id -> subject_id -> average percentage,
-    using up to the latest three exams per subject.
-    """
-    subject_scores: Dict[int, Dict[int, List[float]]] = defaultdict(lambda: defaultdict(list))
-    marks = (
-        ExamMark.objects.filter(exam__class_offering=class_offering)
-        .select_related("exam", "student_enrollment")
-        .order_by("-exam__date", "-exam_id")
-        .all()
-    )
-    for mark in marks:
-        exam = mark.exam
-        enrollment = mark.student_enrollment
-        percent = float(mark.marks_obtained) / float(exam.max_marks) * 100 if exam.max_marks else 0
-        scores = subject_scores[enrollment.id][exam.subject_id]
-        if len(scores) < 3:
-            scores.append(percent)
-
-    averages: Dict[int, Dict[int, float]] = defaultdict(dict)
-    for enrollment_id, subj_map in subject_scores.items():
-        for subject_id, scores in subj_map.items():
-            averages[enrollment_id][subject_id] = (sum(scores) / len(scores)) if scores else 0.0
-    return averages
+        return ExamMark.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["exam", "student_enrollment"],
+            update_fields=["marks_obtained", "entered_by"],
+        )
 
 
 def promote_class(
@@ -142,92 +142,233 @@ def promote_class(
     run_by: User,
     from_class_offering: ClassOffering,
 ) -> PromotionBatch:
+    return promote_classes(run_by=run_by, offerings=[from_class_offering])[0]
+
+
+def promote_classes(
+    *,
+    run_by: User,
+    offerings: Iterable[ClassOffering],
+) -> List[PromotionBatch]:
+    """
+    Promote several class offerings, returning one batch per offering.
+
+    Reference data, enrollments, marks and existing target enrollments are loaded once
+    for all offerings. Enrollments are read up front, so students moved into a selected
+    offering during this run are not promoted again. Batches are created in one
+    transaction and promotions applied in chunks of PROMOTION_CHUNK_SIZE; if a chunk
+    fails, batches with unapplied promotions are marked partial and the error re-raised.
+    """
     if not run_by.is_superuser:
         raise PermissionDenied("Only admins can run promotions.")
 
+    offerings = list(offerings)
     current_year = timezone.now().year
-    if from_class_offering.academic_year.year > current_year:
-        raise ValidationError("Cannot promote a future academic year.")
-
-    # Determine target offerings for pass and fail.
-    next_year = AcademicYear.objects.filter(year=from_class_offering.academic_year.year + 1).first()
-    if not next_year:
-        raise ValidationError("Next academic year is not configured.")
+    for offering in offerings:
+        if offering.academic_year.year > current_year:
+            raise ValidationError("Cannot promote a future academic year.")
 
-    class_levels = {cl.code: cl for cl in ClassLevel.objects.all()}
-    from_level_code = from_class_offering.class_level.code
-    next_level_code = from_level_code + 1
+    next_years = {
+        year.year: year
+        for year in AcademicYear.objects.filter(year__in={o.academic_year.year + 1 for o in offerings})
+    }
+    class_levels = class_levels_by_code()
 
-    repeat_offering = get_or_create_offering(next_year, class_levels[from_level_code])
-    promote_offering: ClassOffering | None = None
-    if next_level_code in class_levels:
-        promote_offering = get_or_create_offering(next_year, class_levels[next_level_code])
-
-    averages = _compute_subject_averages(from_class_offering)
-    enrollments = list(
-        StudentEnrollment.objects.filter(class_offering=from_class_offering, active=True).select_related("student")
+    # Determine target offerings for pass and fail.
+    targets: Dict[int, Tuple[ClassOffering, ClassOffering | None]] = {}
+    for offering in offerings:
+        next_year = next_years.get(offering.academic_year.year + 1)
+        if not next_year:
+            raise ValidationError("Next academic year is not configured.")
+        from_level_code = offering.class_level.code
+        repeat_offering = get_or_create_offering(next_year, class_levels[from_level_code])
+        promote_offering: ClassOffering | None = None
+        if from_level_code + 1 in class_levels:
+            promote_offering = get_or_create_offering(next_year, class_levels[from_level_code + 1])
+        targets[offering.id] = (repeat_offering, promote_offering)
+
+    # Rank in an inner query, then average: a window filtered after GROUP BY would rank groups.
+    graded_marks = latest_marks_per_subject(
+        ExamMark.objects.filter(student_enrollment=OuterRef(OuterRef("pk")))
+    ).values("pk")
+    failing_subjects = (
+        ExamMark.objects.filter(student_enrollment=OuterRef("pk"), pk__in=graded_marks)
+        .order_by()
+        .values("exam__subject_id")
+        .annotate(avg_percent=Avg(mark_percent_expression()))
+        .filter(avg_percent__lt=40)
     )
-
-    with transaction.atomic():
-        batch = PromotionBatch.objects.create(
-            from_class_offering=from_class_offering,
-            to_class_offering=promote_offering or repeat_offering,
-            run_by=run_by,
+    enrollments_by_offering: Dict[int, List[StudentEnrollment]] = defaultdict(list)
+    enrollments = (
+        StudentEnrollment.objects.filter(class_offering__in=offerings, active=True)
+        .select_related("student")
+        .only("id", "active", "student_id", "academic_year_id", "class_offering_id", "student__id", "student__student_id")
+        .annotate(
+            has_failing_subject=Exists(failing_subjects),
+            has_marks=Exists(ExamMark.objects.filter(student_enrollment=OuterRef("pk"))),
         )
+    )
+    for enrollment in enrollments:
+        enrollments_by_offering[enrollment.class_offering_id].append(enrollment)
+
+    target_offerings = {o.id: o for pair in targets.values() for o in pair if o}
+    student_ids = {e.student_id for group in enrollments_by_offering.values() for e in group}
+    existing_targets: Dict[Tuple[int, int], int] = {}
+    active_next_year = set()
+    # Only ids are needed to skip existing targets, so avoid building model instances.
+    for existing_id, student_id, class_offering_id, academic_year_id, active in StudentEnrollment.objects.filter(
+        Q(class_offering_id__in=target_offerings) | Q(active=True),
+        student_id__in=student_ids,
+        academic_year__in=next_years.values(),
+    ).values_list("id", "student_id", "class_offering_id", "academic_year_id", "active"):
+        if class_offering_id in target_offerings:
+            existing_targets[(student_id, class_offering_id)] = existing_id
+        if active:
+            active_next_year.add((student_id, academic_year_id))
 
-        for enrollment in enrollments:
-            subject_scores = averages.get(enrollment.id, {})
-            # If no marks exist for a subject, treat as fail to avoid blind promotion.
-            has_fail = False
-            if not subject_scores:
-                has_fail = True
-            else:
-                for score in subject_scores.values():
-                    if score < 40:
-                        has_fail = True
-                        break
-
-            target_offering = promote_offering if (promote_offering and not has_fail) else repeat_offering
-
-            existing_target = StudentEnrollment.objects.filter(
-                student=enrollment.student, class_offering=target_offering
-            ).first()
-
-            if existing_target:
-                # Skip creation to avoid constraint violations; keep current enrollment active.
-                PromotionResult.objects.create(
-                    batch=batch,
-                    student=enrollment.student,
-                    from_enrollment=enrollment,
-                    to_enrollment=existing_target,
-                    status=PromotionResult.STATUS_SKIPPED,
-                    notes="Existing enrollment in target class/year; skipped auto-promotion.",
-                )
-                continue
-
-            new_enrollment = StudentEnrollment.objects.create(
-                student=enrollment.student,
-                academic_year=target_offering.academic_year,
-                class_offering=target_offering,
-                active=True,
+    with transaction.atomic():
+        # Lifelong IDs are normally issued on first enrollment, so this rarely does any work.
+        for group in enrollments_by_offering.values():
+            for enrollment in group:
+                if not enrollment.student.student_id:
+                    enrollment.student.assign_student_id(persist=True)
+
+        batches: List[PromotionBatch] = []
+        results: List[PromotionResult] = []
+        promotions: List[Tuple[PromotionBatch, StudentEnrollment, StudentEnrollment, bool]] = []
+        for offering in offerings:
+            repeat_offering, promote_offering = targets[offering.id]
+            batch = PromotionBatch(
+                from_class_offering=offering,
+                to_class_offering=promote_offering or repeat_offering,
+                run_by=run_by,
             )
-            enrollment.active = False
-            enrollment.save(update_fields=["active"])
+            # Targets are the same or next level in the next year by construction.
+            batch.save(skip_clean=True)
+            batches.append(batch)
+
+            for enrollment in enrollments_by_offering[offering.id]:
+                # Without any marks, treat as fail to avoid blind promotion.
+                has_fail = enrollment.has_failing_subject or not enrollment.has_marks
+                target_offering = promote_offering if (promote_offering and not has_fail) else repeat_offering
+
+                existing_target_id = existing_targets.get((enrollment.student_id, target_offering.id))
+                if existing_target_id:
+                    # Skip creation to avoid constraint violations; keep current enrollment active.
+                    results.append(
+                        PromotionResult(
+                            batch=batch,
+                            student=enrollment.student,
+                            from_enrollment=enrollment,
+                            to_enrollment_id=existing_target_id,
+                            status=PromotionResult.STATUS_SKIPPED,
+                            notes="Existing enrollment in target class/year; skipped auto-promotion.",
+                        )
+                    )
+                    continue
+
+                # New enrollments skip save()/full_clean(), so apply its checks here.
+                if target_offering.academic_year.year < current_year:
+                    raise ValidationError("Cannot enroll students in past academic years.")
+                if (enrollment.student_id, target_offering.academic_year_id) in active_next_year:
+                    raise ValidationError("Student already has an active enrollment for this academic year.")
+                new_enrollment = StudentEnrollment(
+                    student_id=enrollment.student_id,
+                    academic_year_id=target_offering.academic_year_id,
+                    class_offering_id=target_offering.id,
+                    student_identifier=enrollment.student.student_id,
+                    active=True,
+                )
+                promotions.append((batch, enrollment, new_enrollment, has_fail))
+
+        PromotionResult.objects.bulk_create(results)
+
+    # Apply promotions in chunks so row locks are held briefly. A failing chunk rolls back
+    # alone; earlier chunks stay committed and the affected batches are marked partial.
+    # Batches were saved as pending, so a run that dies outright is never reported completed.
+    for start in range(0, len(promotions), PROMOTION_CHUNK_SIZE):
+        try:
+            with transaction.atomic():
+                _apply_promotions(promotions[start : start + PROMOTION_CHUNK_SIZE], target_offerings)
+        except Exception:
+            unapplied = {batch.pk for batch, _, _, _ in promotions[start:]}
+            _set_batch_status(batches, PromotionBatch.STATUS_PARTIAL, unapplied)
+            _set_batch_status(batches, PromotionBatch.STATUS_COMPLETED, {b.pk for b in batches} - unapplied)
+            raise
+    _set_batch_status(batches, PromotionBatch.STATUS_COMPLETED, {b.pk for b in batches})
+    return batches
+
+
+def _set_batch_status(batches: List[PromotionBatch], status: str, batch_ids: set) -> None:
+    if not batch_ids:
+        return
+    PromotionBatch.objects.filter(pk__in=batch_ids).update(status=status)
+    for batch in batches:
+        if batch.pk in batch_ids:
+            batch.status = status
+
+
+def _apply_promotions(
+    promotions: List[Tuple[PromotionBatch, StudentEnrollment, StudentEnrollment, bool]],
+    target_offerings: Dict[int, ClassOffering],
+) -> None:
+    # Reserve each target offering's block of roll numbers with a single UPDATE.
+    new_by_target: Dict[int, List[StudentEnrollment]] = defaultdict(list)
+    for _, _, new_enrollment, _ in promotions:
+        new_by_target[new_enrollment.class_offering_id].append(new_enrollment)
+    for target_id, new_enrollments in new_by_target.items():
+        first_roll = target_offerings[target_id].reserve_roll_numbers(len(new_enrollments))
+        for offset, new_enrollment in enumerate(new_enrollments):
+            new_enrollment.roll_number = first_roll + offset
+
+    StudentEnrollment.objects.bulk_create([new_enrollment for _, _, new_enrollment, _ in promotions])
+    StudentEnrollment.objects.filter(pk__in=[enrollment.pk for _, enrollment, _, _ in promotions]).update(
+        active=False
+    )
 
-            PromotionResult.objects.create(
+    # Keep each profile's roll and current class in sync, as StudentEnrollment.save() would.
+    profiles = {}
+    for _, enrollment, new_enrollment, _ in promotions:
+        enrollment.active = False
+        student = enrollment.student
+        student.roll_number = new_enrollment.roll_number
+        student.current_academic_year_id = new_enrollment.academic_year_id
+        student.current_class_level_id = target_offerings[new_enrollment.class_offering_id].class_level_id
+        profiles[student.pk] = student
+    StudentProfile.objects.bulk_update(profiles.values(), ["roll_number", "current_academic_year", "current_class_level"])
+
+    PromotionResult.objects.bulk_create(
+        [
+            PromotionResult(
                 batch=batch,
                 student=enrollment.student,
                 from_enrollment=enrollment,
                 to_enrollment=new_enrollment,
                 status=PromotionResult.STATUS_PASSED if not has_fail else PromotionResult.STATUS_FAILED,
             )
-        return batch
+            for batch, enrollment, new_enrollment, has_fail in promotions
+        ]
+    )
+
+
+def subjects_for_offerings(offerings: Iterable) -> Dict[int, List[Subject]]:
+    """
+    Returns mapping class_offering_id -> subjects taught there (by name), in one query.
+    """
+    rows = (
+        TeacherAssignment.objects.filter(class_offering__in=offerings)
+        .order_by("subject__name")
+        .values_list("class_offering_id", "subject_id", "subject__name")
+        .distinct()
+    )
+    subjects: Dict[int, List[Subject]] = defaultdict(list)
+    for class_offering_id, subject_id, subject_name in rows:
+        subjects[class_offering_id].append(Subject(id=subject_id, name=subject_name))
+    return subjects
 
 
 def subjects_for_enrollment(enrollment: StudentEnrollment) -> Iterable[Subject]:
-    return Subject.objects.filter(
-        teacher_assignments__class_offering=enrollment.class_offering
-    ).distinct()
+    return subjects_for_offerings([enrollment.class_offering_id]).get(enrollment.class_offering_id, [])
 
 
 def upcoming_exams_for_enrollment(enrollment: StudentEnrollment):
@@ -248,13 +389,26 @@ def marks_for_enrollment(enrollment: StudentEnrollment):
 
 
 def historical_results(student: StudentProfile):
-    enrollments = (
-        StudentEnrollment.objects.filter(student=student)
-        .select_related("class_offering__academic_year", "class_offering__class_level")
+    return historical_results_bulk([student]).get(student.pk, [])
+
+
+def historical_results_bulk(students: Iterable[StudentProfile]) -> Dict[int, List[dict]]:
+    """
+    Returns mapping student_id -> per-enrollment results, newest year first,
+    using one enrollment query and one marks query for all students.
+    """
+    enrollments = list(
+        StudentEnrollment.objects.filter(student__in=students)
+        .select_related(
+            "student",
+            "academic_year",
+            "class_offering__academic_year",
+            "class_offering__class_level",
+        )
         .order_by("-academic_year__year")
     )
-    results = []
     averages_by_enrollment = _compute_subject_averages_for_student(enrollments)
+    results: Dict[int, List[dict]] = defaultdict(list)
     for enrollment in enrollments:
         subjects = averages_by_enrollment.get(enrollment.id, {})
         overall_percent = None
@@ -264,7 +418,7 @@ def historical_results(student: StudentProfile):
             overall_percent = sum(values) / len(values) if values else None
             if overall_percent is not None:
                 overall_grade = grade_from_percent(overall_percent)
-        results.append(
+        results[enrollment.student_id].append(
             {
                 "enrollment": enrollment,
                 "subjects": subjects,
@@ -275,23 +429,51 @@ def historical_results(student: StudentProfile):
     return results
 
 
+def dashboard_bundle(student: StudentProfile, current_year: AcademicYear | None = None) -> dict:
+    """
+    Everything the student dashboard shows, read in one transaction.
+
+    The current enrollment and its grade come from the student's history rather than
+    separate lookups; the enrollment is the active one in the current year, falling
+    back to the latest active enrollment.
+    """
+    if current_year is None:
+        current_year = get_current_academic_year()
+    with transaction.atomic():
+        history = historical_results_bulk([student]).get(student.pk, [])
+        active = [item for item in history if item["enrollment"].active]
+        current = next(
+            (item for item in active if current_year and item["enrollment"].academic_year_id == current_year.id),
+            active[0] if active else None,
+        )
+        enrollment = current["enrollment"] if current else None
+        return {
+            "enrollment": enrollment,
+            "subjects": subjects_for_enrollment(enrollment) if enrollment else [],
+            "upcoming_exams": list(upcoming_exams_for_enrollment(enrollment)) if enrollment else [],
+            "marks": list(marks_for_enrollment(enrollment)) if enrollment else [],
+            "history": history,
+            "current_grade": {
+                "overall_percent": current["overall_percent"] if current else None,
+                "overall_grade": current["overall_grade"] if current else None,
+            },
+        }
+
+
 def _compute_subject_averages_for_student(enrollments: Iterable[StudentEnrollment]):
     enrollment_ids = [e.id for e in enrollments]
     marks = (
-        ExamMark.objects.filter(student_enrollment_id__in=enrollment_ids)
-        .select_related("exam", "student_enrollment")
+        latest_marks_per_subject(
+            ExamMark.objects.filter(student_enrollment_id__in=enrollment_ids).annotate(
+                percent=mark_percent_expression()
+            )
+        )
         .order_by("-exam__date", "-exam_id")
-        .all()
+        .values_list("student_enrollment_id", "exam__subject__name", "percent")
     )
     subject_scores: Dict[int, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
-    for mark in marks:
-        exam = mark.exam
-        enrollment_id = mark.student_enrollment_id
-        subject_name = exam.subject.name
-        percent = float(mark.marks_obtained) / float(exam.max_marks) * 100 if exam.max_marks else 0
-        scores = subject_scores[enrollment_id][subject_name]
-        if len(scores) < 3:
-            scores.append(percent)
+    for enrollment_id, subject_name, percent in marks:
+        subject_scores[enrollment_id][subject_name].append(percent)
 
     averages = defaultdict(dict)
     for enrollment_id, subject_map in subject_scores.items():
@@ -300,20 +482,6 @@ def _compute_subject_averages_for_student(enrollments: Iterable[StudentEnrollmen
     return averages
 
 
-def grade_from_percent(percent: float) -> str:
-    if percent >= 80:
-        return "A+"
-    if percent >= 70:
-        return "A"
-    if percent >= 60:
-        return "B"
-    if percent >= 50:
-        return "C"
-    if percent >= 40:
-        return "D"
-    return "F"
-
-
 def grade_for_enrollment(enrollment: StudentEnrollment):
     averages = _compute_subject_averages_for_student([enrollment]).get(enrollment.id, {})
     if not averages:
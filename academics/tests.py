@@ -0,0 +1,205 @@
+import datetime
+from collections import Counter
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from accounts.models import StudentProfile
+from . import services
+from .models import (
+    AcademicYear,
+    ClassOffering,
+    Exam,
+    ExamMark,
+    PromotionBatch,
+    PromotionResult,
+    StudentEnrollment,
+    Subject,
+    grade_from_percent,
+    latest_marks_per_subject,
+)
+
+
+class GradeFromPercentTests(SimpleTestCase):
+    def test_band_boundaries(self):
+        cases = [
+            (-5, "F"),
+            (0, "F"),
+            (39.99, "F"),
+            (40, "D"),
+            (49.99, "D"),
+            (50, "C"),
+            (60, "B"),
+            (70, "A"),
+            (79.99, "A"),
+            (80, "A+"),
+            (100, "A+"),
+            (120, "A+"),
+        ]
+        for percent, grade in cases:
+            with self.subTest(percent=percent):
+                self.assertEqual(grade_from_percent(percent), grade)
+
+
+class AcademicsTestCase(TestCase):
+    """
+    Works in the seeded current-year CLASS 6 offering; migrations provide years, levels and subjects.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.year = AcademicYear.objects.get(year=timezone.now().year)
+        cls.offering = ClassOffering.objects.get(academic_year=cls.year, class_level__code=6)
+        cls.subjects = list(Subject.objects.order_by("name"))
+
+    def enroll(self, username):
+        student = StudentProfile.objects.create(user=User.objects.create_user(username, password="pw"))
+        return services.enroll_student(student, self.offering)
+
+    def exam(self, subject, day, max_marks=100):
+        exam = Exam(
+            class_offering=self.offering,
+            academic_year=self.year,
+            subject=subject,
+            title=f"{subject.name} {day}",
+            date=datetime.date(self.year.year, 1, day),
+            max_marks=max_marks,
+            status=Exam.STATUS_PUBLISHED,
+            creator=self.admin,
+        )
+        # Past dates and a fourth exam per subject are only reachable without clean().
+        exam.save(skip_clean=True)
+        return exam
+
+    def mark(self, exam, enrollment, value):
+        return ExamMark.objects.create(
+            exam=exam, student_enrollment=enrollment, marks_obtained=value, entered_by=self.admin
+        )
+
+
+class ReserveRollNumbersTests(AcademicsTestCase):
+    def test_reserves_consecutive_blocks(self):
+        self.assertEqual(self.offering.reserve_roll_numbers(3), 1)
+        self.assertEqual(self.offering.reserve_roll_numbers(), 4)
+        self.offering.refresh_from_db()
+        self.assertEqual(self.offering.next_roll, 4)
+
+    def test_enrollments_are_numbered_in_order(self):
+        rolls = [self.enroll(f"s{i}").roll_number for i in range(3)]
+        self.assertEqual(rolls, [1, 2, 3])
+
+    def test_saving_a_stale_offering_keeps_the_counter(self):
+        stale = ClassOffering.objects.get(pk=self.offering.pk)
+        self.enroll("first")
+        stale.save()
+        self.assertEqual(ClassOffering.objects.get(pk=self.offering.pk).next_roll, 1)
+        self.assertEqual(self.enroll("second").roll_number, 2)
+
+    def test_rejected_enrollment_does_not_use_a_roll(self):
+        enrollment = self.enroll("s1")
+        with self.assertRaises(ValidationError):
+            services.enroll_student(enrollment.student, self.offering)
+        self.assertEqual(ClassOffering.objects.get(pk=self.offering.pk).next_roll, 1)
+
+
+class LatestMarksPerSubjectTests(AcademicsTestCase):
+    def setUp(self):
+        self.enrollment = self.enroll("s1")
+        self.other = self.enroll("s2")
+        # Four exams in one subject: the oldest (a zero) falls outside the graded three.
+        self.exams = [self.exam(self.subjects[0], day) for day in (1, 2, 3, 4)]
+        for exam, value in zip(self.exams, (0, 50, 50, 50)):
+            self.mark(exam, self.enrollment, value)
+            self.mark(exam, self.other, value)
+        self.mark(self.exam(self.subjects[1], 5), self.enrollment, 80)
+
+    def test_keeps_latest_three_per_enrollment_and_subject(self):
+        graded = latest_marks_per_subject(ExamMark.objects.all()).values_list("student_enrollment_id", "exam_id")
+        counts = Counter(enrollment_id for enrollment_id, _ in graded)
+        self.assertEqual(counts, {self.enrollment.id: 4, self.other.id: 3})
+        self.assertNotIn(self.exams[0].id, {exam_id for _, exam_id in graded})
+
+    def test_grading_paths_agree(self):
+        expected = (50 + 80) / 2
+        prefetched = StudentEnrollment.with_marks_prefetched(StudentEnrollment.objects.filter(pk=self.enrollment.pk))
+        self.assertEqual(self.enrollment.compute_overall_percent(), expected)
+        self.assertEqual(prefetched[0].compute_overall_percent(), expected)
+        self.assertEqual(services.grade_for_enrollment(self.enrollment)["overall_percent"], expected)
+
+    def test_promotion_uses_the_graded_marks(self):
+        batch = services.promote_class(run_by=self.admin, from_class_offering=self.offering)
+        self.assertEqual(
+            set(batch.results.values_list("status", flat=True)),
+            {PromotionResult.STATUS_PASSED},
+        )
+
+
+class PromoteClassesTests(AcademicsTestCase):
+    def setUp(self):
+        self.enrollments = [self.enroll(f"s{i}") for i in range(5)]
+        exam = self.exam(self.subjects[0], 1)
+        # Three pass, one fails, and the last has no marks (treated as a fail).
+        for enrollment, value in zip(self.enrollments, (75, 75, 75, 20)):
+            self.mark(exam, enrollment, value)
+
+    def test_promotes_passes_and_completes_batch(self):
+        batch = services.promote_class(run_by=self.admin, from_class_offering=self.offering)
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, PromotionBatch.STATUS_COMPLETED)
+        self.assertEqual(
+            Counter(batch.results.values_list("status", flat=True)),
+            {PromotionResult.STATUS_PASSED: 3, PromotionResult.STATUS_FAILED: 2},
+        )
+        next_year = self.year.year + 1
+        self.assertEqual(
+            StudentEnrollment.objects.filter(academic_year__year=next_year, class_offering__class_level__code=7).count(),
+            3,
+        )
+        self.assertFalse(StudentEnrollment.objects.filter(class_offering=self.offering, active=True).exists())
+
+    def test_applies_promotions_in_chunks(self):
+        with (
+            mock.patch.object(services, "PROMOTION_CHUNK_SIZE", 2),
+            mock.patch.object(services, "_apply_promotions", wraps=services._apply_promotions) as apply,
+        ):
+            services.promote_class(run_by=self.admin, from_class_offering=self.offering)
+        self.assertEqual([len(call.args[0]) for call in apply.call_args_list], [2, 2, 1])
+
+    def test_batch_is_pending_while_promotions_apply(self):
+        seen = []
+        original = services._apply_promotions
+
+        def apply(promotions, targets):
+            seen.append(PromotionBatch.objects.get().status)
+            original(promotions, targets)
+
+        with mock.patch.object(services, "_apply_promotions", side_effect=apply):
+            services.promote_class(run_by=self.admin, from_class_offering=self.offering)
+        self.assertEqual(seen, [PromotionBatch.STATUS_PENDING])
+
+    def test_failing_chunk_marks_batch_partial(self):
+        original = services._apply_promotions
+        calls = []
+
+        def apply(promotions, targets):
+            calls.append(len(promotions))
+            if len(calls) == 2:
+                raise RuntimeError("boom")
+            original(promotions, targets)
+
+        with (
+            mock.patch.object(services, "PROMOTION_CHUNK_SIZE", 2),
+            mock.patch.object(services, "_apply_promotions", side_effect=apply),
+            self.assertRaises(RuntimeError),
+        ):
+            services.promote_class(run_by=self.admin, from_class_offering=self.offering)
+
+        batch = PromotionBatch.objects.get()
+        self.assertEqual(batch.status, PromotionBatch.STATUS_PARTIAL)
+        # The first chunk stays committed; the rest remain in their current class.
+        self.assertEqual(StudentEnrollment.objects.filter(academic_year__year=self.year.year + 1).count(), 2)
+        self.assertEqual(StudentEnrollment.objects.filter(class_offering=self.offering, active=True).count(), 3)
@@ -13,3 +13,61 @@ class EmailExistsPasswordResetForm(PasswordResetForm):
         if not list(self.get_users(email)):
             raise forms.ValidationError("No account found with that email.")
         return email
+
+
+class ExamCreateForm(forms.Form):
+    """
+    Validates the teacher exam-creation form; assignments are limited to the caller's own.
+    """
+
+    assignment = forms.ModelChoiceField(
+        queryset=None,
+        error_messages={"invalid_choice": "Invalid assignment selected.", "required": "Invalid assignment selected."},
+    )
+    title = forms.CharField(max_length=128)
+    date = forms.DateField(error_messages={"invalid": "Invalid exam date."})
+    max_marks = forms.IntegerField(
+        min_value=1,
+        max_value=100,
+        required=False,
+        error_messages={"invalid": "Max marks must be a number."},
+    )
+
+    def __init__(self, *args, assignments, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["assignment"].queryset = assignments
+
+    def clean_max_marks(self):
+        max_marks = self.cleaned_data.get("max_marks")
+        return 100 if max_marks is None else max_marks
+
+
+class ExamMarksForm(forms.Form):
+    """
+    One optional mark field per enrollment still awaiting a mark, named mark_<enrollment id>.
+    """
+
+    def __init__(self, *args, exam, enrollments, **kwargs):
+        super().__init__(*args, **kwargs)
+        for enrollment in enrollments:
+            range_error = f"Mark for {enrollment.student} must be between 0 and {exam.max_marks}."
+            self.fields[f"mark_{enrollment.id}"] = forms.FloatField(
+                required=False,
+                min_value=0,
+                max_value=exam.max_marks,
+                error_messages={
+                    "invalid": f"Invalid mark for {enrollment.student}.",
+                    "min_value": range_error,
+                    "max_value": range_error,
+                },
+            )
+
+    def marks(self, enrollments):
+        """
+        Returns (enrollment, value) for every valid, non-empty mark; call after is_valid().
+        """
+        return [
+            (enrollment, self.cleaned_data[f"mark_{enrollment.id}"])
+            for enrollment in enrollments
+            if self.cleaned_data.get(f"mark_{enrollment.id}") is not None
+        ]
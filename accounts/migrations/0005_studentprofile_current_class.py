@@ -6,24 +6,39 @@ def backfill_current_class(apps, schema_editor):
     StudentProfile = apps.get_model("accounts", "StudentProfile")
     StudentEnrollment = apps.get_model("academics", "StudentEnrollment")
 
-    for student in StudentProfile.objects.all():
-        enrollment = (
-            StudentEnrollment.objects.filter(student=student, active=True)
-            .select_related("academic_year", "class_offering__class_level")
-            .order_by("-academic_year__year")
-            .first()
-        )
-        if not enrollment:
-            continue
-        updates = {}
+    # Latest active enrollment per student, fetched in a single query.
+    latest = (
+        StudentEnrollment.objects.filter(active=True)
+        .select_related("class_offering")
+        .order_by("student_id", "-academic_year__year", "-id")
+    )
+    if schema_editor.connection.vendor == "postgresql":
+        latest = latest.distinct("student_id")
+    by_student = {}
+    for enrollment in latest:
+        by_student.setdefault(enrollment.student_id, enrollment)
+
+    changed = []
+    profiles = StudentProfile.objects.filter(pk__in=by_student).only(
+        "id", "roll_number", "current_academic_year_id", "current_class_level_id"
+    )
+    for student in profiles:
+        enrollment = by_student[student.pk]
+        updated = False
         if enrollment.roll_number is not None and student.roll_number != enrollment.roll_number:
-            updates["roll_number"] = enrollment.roll_number
+            student.roll_number = enrollment.roll_number
+            updated = True
         if student.current_academic_year_id != enrollment.academic_year_id:
-            updates["current_academic_year_id"] = enrollment.academic_year_id
+            student.current_academic_year_id = enrollment.academic_year_id
+            updated = True
         if student.current_class_level_id != enrollment.class_offering.class_level_id:
-            updates["current_class_level_id"] = enrollment.class_offering.class_level_id
-        if updates:
-            StudentProfile.objects.filter(pk=student.pk).update(**updates)
+            student.current_class_level_id = enrollment.class_offering.class_level_id
+            updated = True
+        if updated:
+            changed.append(student)
+    StudentProfile.objects.bulk_update(
+        changed, ["roll_number", "current_academic_year", "current_class_level"], batch_size=1000
+    )
 
 
 def noop(apps, schema_editor):
@@ -1,3 +1,130 @@
+import datetime
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from academics import services
+from academics.models import AcademicYear, ClassOffering, Exam, Subject, TeacherAssignment
+from .forms import ExamCreateForm, ExamMarksForm
+from .models import StudentProfile, TeacherProfile
+
+
+class ExamFormTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.year = AcademicYear.objects.get(year=timezone.now().year)
+        cls.offering = ClassOffering.objects.get(academic_year=cls.year, class_level__code=6)
+        cls.subject = Subject.objects.order_by("name").first()
+        cls.teacher_user = User.objects.create_user("teacher", password="pw")
+        cls.teacher = TeacherProfile.objects.create(user=cls.teacher_user)
+        cls.assignment = services.assign_teacher(cls.teacher, cls.offering, cls.subject)
+
+
+class ExamCreateFormTests(ExamFormTestCase):
+    def form(self, **overrides):
+        data = {
+            "assignment": self.assignment.pk,
+            "title": "Midterm",
+            "date": timezone.localdate().isoformat(),
+            "max_marks": "",
+        }
+        data.update(overrides)
+        return ExamCreateForm(data, assignments=TeacherAssignment.objects.filter(teacher=self.teacher))
+
+    def test_defaults_max_marks_to_100(self):
+        form = self.form()
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["max_marks"], 100)
+        self.assertEqual(form.cleaned_data["assignment"], self.assignment)
+
+    def test_rejects_max_marks_out_of_range(self):
+        for value in ("0", "101", "abc"):
+            with self.subTest(max_marks=value):
+                self.assertIn("max_marks", self.form(max_marks=value).errors)
+
+    def test_rejects_other_teachers_assignments(self):
+        other = TeacherProfile.objects.create(user=User.objects.create_user("other", password="pw"))
+        assignment = services.assign_teacher(other, self.offering, Subject.objects.order_by("name").last())
+        form = self.form(assignment=assignment.pk)
+        self.assertEqual(form.errors["assignment"], ["Invalid assignment selected."])
+
+
+class ExamMarksFormTests(ExamFormTestCase):
+    def setUp(self):
+        self.exam = Exam(
+            class_offering=self.offering,
+            academic_year=self.year,
+            subject=self.subject,
+            title="Quiz",
+            date=datetime.date(self.year.year, 1, 1),
+            max_marks=50,
+            status=Exam.STATUS_PUBLISHED,
+            creator=self.teacher_user,
+        )
+        self.exam.save(skip_clean=True)
+        self.enrollments = [
+            services.enroll_student(
+                StudentProfile.objects.create(user=User.objects.create_user(f"s{i}", password="pw")), self.offering
+            )
+            for i in range(4)
+        ]
+
+    def test_keeps_valid_marks_and_reports_the_rest(self):
+        a, b, c, d = self.enrollments
+        data = {f"mark_{a.id}": "40", f"mark_{b.id}": "51", f"mark_{c.id}": "", f"mark_{d.id}": "nan"}
+        form = ExamMarksForm(data, exam=self.exam, enrollments=self.enrollments)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.marks(self.enrollments), [(a, 40.0)])
+        self.assertEqual(set(form.errors), {f"mark_{b.id}", f"mark_{d.id}"})
+        self.assertIn("between 0 and 50", form.errors[f"mark_{b.id}"][0])
+
+
+class RoleRedirectTests(TestCase):
+    def signup(self, username="student"):
+        return self.client.post(
+            "/register/student/",
+            {"username": username, "email": f"{username}@example.com", "password": "pw", "confirm_password": "pw"},
+        )
+
+    def test_signup_caches_student_dashboard(self):
+        self.signup()
+        self.assertEqual(self.client.session["role_dest"], "accounts:student_dashboard")
+        self.assertRedirects(self.client.get("/role-redirect/"), "/dashboard/student/", fetch_redirect_response=False)
+
+    def test_role_change_drops_stale_destination(self):
+        self.signup()
+        # Creating a teacher profile removes the student profile (see accounts.models).
+        TeacherProfile.objects.create(user=User.objects.get(username="student"))
+        response = self.client.get("/role-redirect/", follow=True)
+        self.assertEqual(response.redirect_chain[-1][0], "/dashboard/teacher/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session["role_dest"], "accounts:teacher_dashboard")
+
+    def test_login_fallback_is_not_cached(self):
+        User.objects.create_user("norole", password="pw")
+        self.client.post("/login/", {"username": "norole", "password": "pw"})
+        self.assertNotIn("role_dest", self.client.session)
+        self.assertRedirects(self.client.get("/role-redirect/"), "/login/", fetch_redirect_response=False)
+        self.assertNotIn("role_dest", self.client.session)
+
+
+class LegacyAccountsRedirectTests(TestCase):
+    def test_redirects_account_pages_to_the_root(self):
+        cases = [
+            ("/accounts/", "/"),
+            ("/accounts/login/?next=/x/", "/login/?next=/x/"),
+            ("/accounts/reset/abc/set-password/", "/reset/abc/set-password/"),
+        ]
+        for url, target in cases:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(response["Location"], target)
 
-# Create your tests here.
+    def test_never_redirects_off_site(self):
+        for url in ("/accounts//evil.com/", "/accounts/\\evil.com/", "/accounts///evil.com"):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                # Unknown pages fall through to handler404, which sends users home.
+                self.assertEqual(response.get("Location"), "/")
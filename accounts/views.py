@@ -4,15 +4,19 @@ from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.http import Http404
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Prefetch, Q
 from django.shortcuts import get_object_or_404
+from django.urls import Resolver404, resolve
 from django.utils import timezone
-import datetime
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.vary import vary_on_cookie
 
 from .models import TeacherProfile, StudentProfile
-from .forms import EmailExistsPasswordResetForm
-from academics.models import StudentEnrollment
+from .forms import EmailExistsPasswordResetForm, ExamCreateForm, ExamMarksForm
 from academics import services as academic_services
-from academics.models import Exam, TeacherAssignment, ExamMark
+from academics.models import Exam, ExamMark, StudentEnrollment, TeacherAssignment
 
 
 class RedirectIfAuthenticatedMixin:
@@ -32,6 +36,12 @@ class CEMSLoginView(RedirectIfAuthenticatedMixin, auth_views.LoginView):
     redirect_authenticated_user = True
     template_name = 'login.html'
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        # Resolve the landing page once; role_redirect reads it back from the session.
+        _remember_role_destination(self.request, _role_destination(form.get_user()))
+        return response
+
 
 class CEMSPasswordResetView(RedirectIfAuthenticatedMixin, auth_views.PasswordResetView):
     template_name = 'password_reset.html'
@@ -54,45 +64,85 @@ def student_register(request):
                 'error': 'Passwords do not match'
             })
 
-        if User.objects.filter(username=username).exists():
+        # The unique username index reports collisions, avoiding a separate lookup.
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username,
+                    email=email,
+                    password=password
+                )
+
+                # create student profile
+                StudentProfile.objects.create(user=user)
+
+                # auto login; a failure here rolls the new account back too
+                login(request, user)
+                request.session['role_dest'] = 'accounts:student_dashboard'
+        except IntegrityError:
             return render(request, 'signup.html', {
                 'error': 'Username already exists'
             })
 
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            password=password
-        )
+        return redirect('accounts:role_redirect')
 
-        # create student profile
-        StudentProfile.objects.create(user=user)
+    return render(request, 'signup.html')
 
-        # auto login
-        login(request, user)
 
-        return redirect('accounts:role_redirect')
+def _role_destination(user):
+    """
+    Return the URL name of the user's landing page, probing both profiles in one query.
+    """
+    if user.is_superuser:
+        return 'accounts:admin_dashboard'
 
-    return render(request, 'signup.html')
+    teacher_id, student_id = (
+        User.objects.filter(pk=user.pk).values_list('teacher_profile__id', 'student_profile__id').first()
+        or (None, None)
+    )
+    if teacher_id is not None:
+        return 'accounts:teacher_dashboard'
+    if student_id is not None:
+        return 'accounts:student_dashboard'
+
+    # fallback
+    return 'accounts:login'
+
+
+# Landing pages worth remembering for the session; others (e.g. the login fallback) are re-resolved.
+_ROLE_DASHBOARDS = {
+    'accounts:admin_dashboard',
+    'accounts:teacher_dashboard',
+    'accounts:student_dashboard',
+}
+
+
+def _remember_role_destination(request, dest):
+    if dest in _ROLE_DASHBOARDS:
+        request.session['role_dest'] = dest
+    else:
+        request.session.pop('role_dest', None)
 
 
 @login_required
 def role_redirect(request):
-    user = request.user
+    # Cached for the session; logout flushes it, and role mismatches drop it.
+    dest = request.session.get('role_dest')
+    if dest is None:
+        dest = _role_destination(request.user)
+        _remember_role_destination(request, dest)
+    return redirect(dest)
 
-    if user.is_superuser:
-        return redirect('accounts:admin_dashboard')
-
-    # teacher check
-    if hasattr(user, 'teacher_profile'):
-        return redirect('accounts:teacher_dashboard')
 
-    # student check
-    if hasattr(user, 'student_profile'):
-        return redirect('accounts:student_dashboard')
+def _reroute_by_role(request):
+    """
+    Send a user whose role doesn't fit the page back through role_redirect.
 
-    # fallback
-    return redirect('accounts:login')
+    The cached destination led here, so it is stale (e.g. the user's role changed
+    mid-session); drop it so role_redirect resolves the role afresh instead of looping.
+    """
+    request.session.pop('role_dest', None)
+    return redirect("accounts:role_redirect")
 
 
 def logout_view(request):
@@ -108,6 +158,10 @@ def catch_home(request):
     return redirect('accounts:role_redirect')
 
 
+# The landing page is identical for every anonymous visitor; Vary: Cookie keeps
+# signed-in users (who are redirected, and never cached) on their own cache keys.
+@cache_page(60 * 15)
+@vary_on_cookie
 def home(request):
     if request.user.is_authenticated:
         return redirect('accounts:role_redirect')
@@ -117,6 +171,7 @@ def home(request):
 
 
 @login_required
+@cache_control(private=True, max_age=60)
 def admin_dashboard(request):
     return render(request, "admin_dashboard.html")
 
@@ -124,23 +179,35 @@ def admin_dashboard(request):
 @login_required
 def admin_student_performance(request):
     if not request.user.is_superuser:
-        return redirect("accounts:role_redirect")
+        return _reroute_by_role(request)
 
-    students = (
-        StudentProfile.objects.select_related("user", "current_academic_year", "current_class_level")
-        .prefetch_related("enrollments__class_offering__class_level", "enrollments__academic_year")
+    active_enrollments = (
+        StudentEnrollment.objects.filter(active=True)
+        .select_related("class_offering__class_level", "academic_year")
+        .order_by("-academic_year__year")
+    )
+    students = list(
+        StudentProfile.objects.select_related("user")
+        .only("id", "student_id", "user__id", "user__username")
+        .prefetch_related(Prefetch("enrollments", queryset=active_enrollments, to_attr="active_enrollments"))
         .order_by("user__username")
     )
+    history_by_student = academic_services.historical_results_bulk(students)
     performance = []
     for student in students:
-        current_enrollment = (
-            StudentEnrollment.objects.filter(student=student, active=True)
-            .select_related("class_offering__class_level", "academic_year")
-            .order_by("-academic_year__year")
-            .first()
-        )
-        current_grade = academic_services.grade_for_enrollment(current_enrollment) if current_enrollment else None
-        history = academic_services.historical_results(student)
+        current_enrollment = student.active_enrollments[0] if student.active_enrollments else None
+        history = history_by_student.get(student.pk, [])
+        current_grade = None
+        if current_enrollment:
+            # History already holds the grade of every enrollment, including the current one.
+            current_grade = next(
+                (
+                    {"overall_percent": item["overall_percent"], "overall_grade": item["overall_grade"]}
+                    for item in history
+                    if item["enrollment"].pk == current_enrollment.pk
+                ),
+                {"overall_percent": None, "overall_grade": None},
+            )
         performance.append(
             {
                 "student": student,
@@ -159,11 +226,12 @@ def admin_student_performance(request):
 @login_required
 def admin_promote_class(request):
     if not request.user.is_superuser:
-        return redirect("accounts:role_redirect")
+        return _reroute_by_role(request)
 
-    years = academic_services.AcademicYear.objects.order_by("year")
-    class_offerings = academic_services.ClassOffering.objects.select_related("academic_year", "class_level").order_by(
-        "academic_year__year", "class_level__code"
+    class_offerings = list(
+        academic_services.ClassOffering.objects.select_related("academic_year", "class_level").order_by(
+            "academic_year__year", "class_level__code"
+        )
     )
     message = None
     errors = []
@@ -171,14 +239,18 @@ def admin_promote_class(request):
 
     if request.method == "POST":
         offering_id = request.POST.get("class_offering_id")
-        from_offering = class_offerings.filter(id=offering_id).first()
+        from_offering = next((offering for offering in class_offerings if str(offering.id) == offering_id), None)
         if not from_offering:
             errors.append("Invalid class offering selected.")
         else:
             try:
                 batch = academic_services.promote_class(run_by=request.user, from_class_offering=from_offering)
                 results = batch.results.select_related(
-                    "student__user", "from_enrollment__class_offering__class_level", "to_enrollment__class_offering__class_level"
+                    "student__user",
+                    "from_enrollment__academic_year",
+                    "from_enrollment__class_offering__class_level",
+                    "to_enrollment__academic_year",
+                    "to_enrollment__class_offering__class_level",
                 )
                 message = f"Promotion created: {batch}"
             except Exception as exc:
@@ -193,6 +265,22 @@ def admin_promote_class(request):
     return render(request, "admin_promote.html", context)
 
 
+def legacy_accounts_redirect(request, rest=""):
+    """
+    Redirect a link from the old accounts/ mount to the same account page at the root.
+
+    Only paths that resolve to an account page are redirected, so the target is always
+    a local path (never "//host/...").
+    """
+    path = "/" + rest.lstrip("/\\")
+    try:
+        resolve(path, urlconf="accounts.urls")
+    except Resolver404:
+        raise Http404("No such account page.")
+    query = request.META.get("QUERY_STRING")
+    return redirect(f"{path}?{query}" if query else path)
+
+
 def handle_404(request, exception=None):
     """
     Redirect all unknown routes to the home view (which will route based on auth state).
@@ -204,29 +292,14 @@ def handle_404(request, exception=None):
 def student_dashboard(request):
     student = getattr(request.user, "student_profile", None)
     if not student:
-        return redirect("accounts:role_redirect")
-
-    current_year = academic_services.get_current_academic_year()
-    enrollment = (
-        StudentEnrollment.objects.filter(student=student, academic_year=current_year, active=True)
-        .select_related("class_offering__class_level", "academic_year")
-        .first()
-    ) or StudentEnrollment.objects.filter(student=student, active=True).order_by("-academic_year__year").first()
-
-    subjects = academic_services.subjects_for_enrollment(enrollment) if enrollment else []
-    upcoming_exams = academic_services.upcoming_exams_for_enrollment(enrollment) if enrollment else []
-    marks = academic_services.marks_for_enrollment(enrollment) if enrollment else []
-    history = academic_services.historical_results(student)
-    current_grade = academic_services.grade_for_enrollment(enrollment) if enrollment else {"overall_percent": None, "overall_grade": None}
+        return _reroute_by_role(request)
 
+    bundle = academic_services.dashboard_bundle(
+        student, current_year=academic_services.get_current_academic_year(request)
+    )
     context = {
         "student": student,
-        "enrollment": enrollment,
-        "subjects": subjects,
-        "upcoming_exams": upcoming_exams,
-        "marks": marks,
-        "history": history,
-        "current_grade": current_grade,
+        **bundle,
     }
     return render(request, "student_dashboard.html", context)
 
@@ -235,30 +308,31 @@ def student_dashboard(request):
 def teacher_dashboard(request):
     teacher = getattr(request.user, "teacher_profile", None)
     if not teacher:
-        return redirect("accounts:role_redirect")
+        return _reroute_by_role(request)
 
-    current_year = academic_services.get_current_academic_year()
+    current_year = academic_services.get_current_academic_year(request)
     assignments = (
         teacher.assignments.all()
         .select_related("class_offering__class_level", "academic_year", "subject")
+        .annotate(
+            student_count=Count(
+                "class_offering__enrollments",
+                filter=Q(class_offering__enrollments__active=True),
+            )
+        )
         .order_by("-academic_year__year", "class_offering__class_level__code")
     )
-    exams = (
-        teacher.user.created_exams.select_related("class_offering__class_level", "academic_year", "subject")
-        .order_by("-academic_year__year", "-date")
-    )
     current_year_val = current_year.year if current_year else timezone.now().year
-    current_exams = exams.filter(academic_year__year=current_year_val)
-    past_exams = exams.filter(academic_year__year__lt=current_year_val).prefetch_related(
-        "marks__student_enrollment__student__user",
-        "marks__student_enrollment",
+    # One query for current and past exams; split by year in Python.
+    exams = list(
+        teacher.user.created_exams.filter(academic_year__year__lte=current_year_val)
+        .select_related("class_offering__class_level", "academic_year", "subject")
+        .order_by("-academic_year__year", "-date")
     )
-    for assignment in assignments:
-        assignment.student_count = StudentEnrollment.objects.filter(
-            class_offering=assignment.class_offering, active=True
-        ).count()
-
-    subject_count = assignments.values_list("subject_id", flat=True).distinct().count()
+    current_exams = [exam for exam in exams if exam.academic_year.year == current_year_val]
+    past_exams = [exam for exam in exams if exam.academic_year.year < current_year_val]
+    assignments = list(assignments)
+    subject_count = len({assignment.subject_id for assignment in assignments})
 
     context = {
         "teacher": teacher,
@@ -277,14 +351,14 @@ def teacher_manage_exam(request, exam_id):
         Exam.objects.select_related("class_offering__class_level", "academic_year", "subject", "creator"),
         pk=exam_id,
     )
-    current_year = academic_services.get_current_academic_year()
+    current_year = academic_services.get_current_academic_year(request)
     current_year_val = current_year.year if current_year else timezone.now().year
 
     # Permission: admin or assigned teacher for class_offering + subject.
     if not request.user.is_superuser:
         teacher_profile = getattr(request.user, "teacher_profile", None)
         if not teacher_profile:
-            return redirect("accounts:role_redirect")
+            return _reroute_by_role(request)
         assignment_exists = TeacherAssignment.objects.filter(
             teacher=teacher_profile,
             class_offering=exam.class_offering,
@@ -297,12 +371,20 @@ def teacher_manage_exam(request, exam_id):
     enrollments = list(
         StudentEnrollment.objects.filter(class_offering=exam.class_offering, active=True)
         .select_related("student__user")
+        .only(
+            "id",
+            "roll_number",
+            "student_identifier",
+            "class_offering_id",
+            "student__id",
+            "student__student_id",
+            "student__user__id",
+            "student__user__username",
+        )
         .order_by("roll_number", "student__user__username")
     )
-    existing_marks = {
-        mark.student_enrollment_id: mark
-        for mark in ExamMark.objects.filter(exam=exam).select_related("student_enrollment__student__user")
-    }
+    # The template reads only marks_obtained; students come from `enrollments`, so no joins.
+    existing_marks = {mark.student_enrollment_id: mark for mark in ExamMark.objects.filter(exam=exam)}
 
     errors = []
     saved_count = 0
@@ -316,34 +398,34 @@ def teacher_manage_exam(request, exam_id):
         if exam.status == Exam.STATUS_DRAFT:
             messages.error(request, "Cannot enter marks while exam is in draft.")
             return redirect("accounts:teacher_manage_exam", exam_id=exam.id)
-        marks_to_create = []
-        for enrollment in enrollments:
-            # Skip if already marked.
-            if enrollment.id in existing_marks:
-                continue
-            raw_value = request.POST.get(f"mark_{enrollment.id}")
-            if raw_value is None or raw_value == "":
-                continue
+        pending = [enrollment for enrollment in enrollments if enrollment.id not in existing_marks]
+        form = ExamMarksForm(request.POST, exam=exam, enrollments=pending)
+        if not form.is_valid():
+            errors = [error for field_errors in form.errors.values() for error in field_errors]
+        # Valid marks are saved even when other rows have errors.
+        marks_to_create = form.marks(pending)
+
+        new_marks = [
+            ExamMark(exam=exam, student_enrollment=enrollment, marks_obtained=value, entered_by=request.user)
+            for enrollment, value in marks_to_create
+        ]
+        while new_marks:
             try:
-                value = float(raw_value)
-            except ValueError:
-                errors.append(f"Invalid mark for {enrollment.student}: {raw_value}")
-                continue
-            if value < 0 or value > exam.max_marks:
-                errors.append(f"Mark for {enrollment.student} must be between 0 and {exam.max_marks}.")
-                continue
-            marks_to_create.append((enrollment, value))
-
-        for enrollment, value in marks_to_create:
-            if ExamMark.objects.filter(exam=exam, student_enrollment=enrollment).exists():
-                continue
-            ExamMark.objects.create(
-                exam=exam,
-                student_enrollment=enrollment,
-                marks_obtained=value,
-                entered_by=request.user,
-            )
-            saved_count += 1
+                with transaction.atomic():
+                    ExamMark.objects.bulk_create(new_marks)
+                break
+            except IntegrityError:
+                # Someone else entered some of these marks meanwhile; theirs stand, retry the rest.
+                taken = set(
+                    ExamMark.objects.filter(
+                        exam=exam, student_enrollment_id__in=[mark.student_enrollment_id for mark in new_marks]
+                    ).values_list("student_enrollment_id", flat=True)
+                )
+                if not taken:
+                    raise
+                new_marks = [mark for mark in new_marks if mark.student_enrollment_id not in taken]
+        saved_count = len(new_marks)
+        existing_marks = {mark.student_enrollment_id: mark for mark in ExamMark.objects.filter(exam=exam)}
 
         if saved_count and not errors:
             messages.success(request, f"Saved {saved_count} marks.")
@@ -353,11 +435,6 @@ def teacher_manage_exam(request, exam_id):
         if errors:
             for err in errors:
                 messages.error(request, err)
-        # Refresh existing marks after save attempts
-        existing_marks = {
-            mark.student_enrollment_id: mark
-            for mark in ExamMark.objects.filter(exam=exam).select_related("student_enrollment__student__user")
-        }
 
     context = {
         "exam": exam,
@@ -373,9 +450,9 @@ def teacher_manage_exam(request, exam_id):
 def teacher_exam_create(request):
     teacher = getattr(request.user, "teacher_profile", None)
     if not (request.user.is_superuser or teacher):
-        return redirect("accounts:role_redirect")
+        return _reroute_by_role(request)
 
-    current_year = academic_services.get_current_academic_year()
+    current_year = academic_services.get_current_academic_year(request)
     assignments = TeacherAssignment.objects.filter(
         academic_year=current_year
     ).select_related("class_offering__class_level", "academic_year", "subject")
@@ -383,50 +460,30 @@ def teacher_exam_create(request):
         assignments = assignments.filter(teacher=teacher)
 
     if request.method == "POST":
-        assignment_id = request.POST.get("assignment_id")
-        title = request.POST.get("title", "").strip()
-        date_str = request.POST.get("date")
-        max_marks_str = request.POST.get("max_marks", "100").strip() or "100"
-
-        assignment = assignments.filter(pk=assignment_id).first()
-        if not assignment:
-            messages.error(request, "Invalid assignment selected.")
+        form = ExamCreateForm(request.POST, assignments=assignments)
+        if not form.is_valid():
+            for field_errors in form.errors.values():
+                for error in field_errors:
+                    messages.error(request, error)
         else:
+            assignment = form.cleaned_data["assignment"]
             try:
-                exam_date = datetime.date.fromisoformat(date_str)
-            except Exception:
-                messages.error(request, "Invalid exam date.")
-                exam_date = None
-            try:
-                max_marks = int(max_marks_str)
-            except ValueError:
-                messages.error(request, "Max marks must be a number.")
-                max_marks = None
-
-            if assignment and title and exam_date and max_marks is not None:
-                try:
-                    exam = academic_services.create_exam(
-                        user=request.user,
-                        class_offering=assignment.class_offering,
-                        subject=assignment.subject,
-                        title=title,
-                        exam_date=exam_date,
-                        max_marks=max_marks,
-                        status=Exam.STATUS_PUBLISHED,
-                    )
-                except Exception as exc:
-                    messages.error(request, str(exc))
-                else:
-                    messages.success(request, f"Exam '{exam.title}' created.")
-                    return redirect("accounts:teacher_dashboard")
+                exam = academic_services.create_exam(
+                    user=request.user,
+                    class_offering=assignment.class_offering,
+                    subject=assignment.subject,
+                    title=form.cleaned_data["title"],
+                    exam_date=form.cleaned_data["date"],
+                    max_marks=form.cleaned_data["max_marks"],
+                    status=Exam.STATUS_PUBLISHED,
+                )
+            except Exception as exc:
+                messages.error(request, str(exc))
+            else:
+                messages.success(request, f"Exam '{exam.title}' created.")
+                return redirect("accounts:teacher_dashboard")
 
     context = {
         "assignments": assignments,
     }
     return render(request, "teacher_exam_create.html", context)
-
-
-def fallback_to_home(request, *args, **kwargs):
-    return redirect('accounts:home')
-
-